@@ -10,9 +10,13 @@ with open("xdrt/__init__.py") as f:
             version = ast.parse(line).body[0].value.s  # type: ignore
             break
 
+import functools
+import hashlib
+import multiprocessing
 import os
 import platform
 import re
+import shutil
 import subprocess
 import sys
 from distutils.version import LooseVersion
@@ -31,11 +35,56 @@ class CMakeExtension(Extension):
         self.sourcedir = os.path.abspath(sourcedir)
 
 
+@functools.lru_cache(maxsize=None)
+def cmake_version_output():
+    """Output of `cmake --version`, only run once per process."""
+    return subprocess.check_output(["cmake", "--version"]).decode()
+
+
+def cmake_version():
+    """Version of CMake, parsed from `cmake --version`."""
+    return LooseVersion(re.search(r"version\s*([\d.]+)", cmake_version_output()).group(1))
+
+
+def build_parallel_level(parallel=None):
+    """Number of parallel build jobs, taken from `build_ext -j`, CMAKE_BUILD_PARALLEL_LEVEL or MAX_JOBS if set."""
+    if parallel:
+        return int(parallel)
+    return int(
+        os.environ.get("CMAKE_BUILD_PARALLEL_LEVEL") or os.environ.get("MAX_JOBS") or multiprocessing.cpu_count()
+    )
+
+
+def find_ninja():
+    """Locate a ninja executable, either from the `ninja` PyPI wheel or from the PATH."""
+    try:
+        import ninja  # type: ignore
+
+        ninja_executable = os.path.join(ninja.BIN_DIR, "ninja")
+        if shutil.which(ninja_executable):
+            return ninja_executable
+    except ImportError:
+        pass
+    return shutil.which("ninja")
+
+
+def cached_cmake_generator(build_dir):
+    """Generator of an already configured CMake build directory, or None if it has not been configured yet."""
+    try:
+        with open(os.path.join(build_dir, "CMakeCache.txt")) as f:
+            for line in f:
+                if line.startswith("CMAKE_GENERATOR:"):
+                    return line.split("=", 1)[1].strip()
+    except OSError:
+        pass
+    return None
+
+
 class CMakeBuild(build_ext):
     # This is from: https://www.benjack.io/2017/06/12/python-cpp-tests.html
     def run(self):
         try:
-            out = subprocess.check_output(["cmake", "--version"])
+            cmake_version_output()
         except OSError:
             raise RuntimeError(
                 "CMake must be installed to build the following extensions: "
@@ -43,8 +92,7 @@ class CMakeBuild(build_ext):
             )
 
         if platform.system() == "Windows":
-            cmake_version = LooseVersion(re.search(r"version\s*([\d.]+)", out.decode()).group(1))
-            if cmake_version < "3.1.0":
+            if cmake_version() < "3.1.0":
                 raise RuntimeError("CMake >= 3.1.0 is required on Windows")
 
         for ext in self.extensions:
@@ -58,8 +106,22 @@ class CMakeBuild(build_ext):
             "-DPYTHON_EXECUTABLE=" + sys.executable,
         ]
 
+        # Only the compiler launcher is set, CC and LDSHARED are left untouched so ccache is never used as linker.
+        ccache_executable = shutil.which("ccache")
+        if ccache_executable:
+            cmake_args += [
+                "-DCMAKE_C_COMPILER_LAUNCHER=" + ccache_executable,
+                "-DCMAKE_CXX_COMPILER_LAUNCHER=" + ccache_executable,
+            ]
+
         cfg = "Debug" if self.debug else "Release"
         build_args = ["--config", cfg]
+        jobs = build_parallel_level(self.parallel)
+
+        # Set XDRT_DISABLE_LTO=1 for toolchains where link-time optimization fails. The option is always passed, as a
+        # value set earlier would otherwise persist in the CMake cache of an existing build directory.
+        enable_lto = cfg == "Release" and os.environ.get("XDRT_DISABLE_LTO", "0") in ("", "0")
+        cmake_args += ["-DXDRT_ENABLE_LTO=" + ("ON" if enable_lto else "OFF")]
 
         if platform.system() == "Windows":
             cmake_args += [
@@ -68,16 +130,45 @@ class CMakeBuild(build_ext):
             ]
             if sys.maxsize > 2 ** 32:
                 cmake_args += ["-A", "x64"]
-            build_args += ["--", "/m"]
+            build_args += ["--", f"/m:{jobs}"]
         else:
             cmake_args += ["-DCMAKE_BUILD_TYPE=" + cfg]
-            build_args += ["--", "-j2"]
+            # Builds are portable by default, set e.g. XDRT_MARCH=native to compile for the build machine only. An
+            # empty value is passed as well, so unsetting it resets the value in the CMake cache.
+            cmake_args += ["-DXDRT_MARCH=" + os.environ.get("XDRT_MARCH", "")]
+            # CMake cannot change the generator of an existing build directory, so Ninja is only selected for new ones.
+            generator = cached_cmake_generator(self.build_temp)
+            ninja_executable = find_ninja()
+            if generator is None and ninja_executable:
+                generator = "Ninja"
+            if generator is not None:
+                cmake_args += ["-G", generator]
+            if generator == "Ninja" and ninja_executable:
+                cmake_args += ["-DCMAKE_MAKE_PROGRAM=" + ninja_executable]
+            # `cmake --build --parallel` requires CMake >= 3.12, older versions pass -j to make or ninja directly.
+            if cmake_version() >= "3.12":
+                build_args += ["--parallel", str(jobs)]
+            else:
+                build_args += ["--", f"-j{jobs}"]
 
         env = os.environ.copy()
         env["CXXFLAGS"] = '{} -DVERSION_INFO=\\"{}\\"'.format(env.get("CXXFLAGS", ""), self.distribution.get_version())
         if not os.path.exists(self.build_temp):
             os.makedirs(self.build_temp)
-        subprocess.check_call(["cmake", ext.sourcedir] + cmake_args, cwd=self.build_temp, env=env)
+
+        # Only (re)configure when there is no CMake cache yet, or when the configuration arguments changed.
+        configure_command = ["cmake", ext.sourcedir] + cmake_args
+        configure_hash = hashlib.sha256("\0".join(configure_command + [env["CXXFLAGS"]]).encode("utf-8")).hexdigest()
+        configure_hash_file = os.path.join(self.build_temp, ".xdrt_cmake_args_hash")
+        previous_hash = None
+        if os.path.exists(os.path.join(self.build_temp, "CMakeCache.txt")) and os.path.exists(configure_hash_file):
+            with open(configure_hash_file) as f:
+                previous_hash = f.read().strip()
+
+        if self.force or previous_hash != configure_hash:
+            subprocess.check_call(configure_command, cwd=self.build_temp, env=env)
+            with open(configure_hash_file, "w") as f:
+                f.write(configure_hash)
         subprocess.check_call(["cmake", "--build", "."] + build_args, cwd=self.build_temp)
         print()  # Add an empty line for cleaner output
 
@@ -127,6 +218,7 @@ setup(
             "pylint",
             "pydantic",
         ],
+        "numexpr": ["numexpr"],
     },
     url="https://github.com/NKI-AI/xdrt",
     version=version,
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""Tests for `xdrt.utils`."""
+
+import pytest
+
+from xdrt.utils import parse_ini
+
+
+def write_ini(tmp_path, text, name="test.INI"):
+    filename = tmp_path / name
+    filename.write_text(text)
+    return filename
+
+
+def test_parse_ini_delimiters(tmp_path):
+    filename = write_ini(
+        tmp_path,
+        "[RECONSTRUCTION]\n"
+        "ReconstructionDate=20200102\n"
+        "ReconstructionTime : 10:20:30\n"
+        "; comment\n"
+        "# comment\n"
+        "Url = a:b=c\n",
+    )
+    assert parse_ini(filename) == {
+        "RECONSTRUCTION": {
+            "reconstructiondate": "20200102",
+            "reconstructiontime": "10:20:30",
+            "url": "a:b=c",
+        }
+    }
+
+
+def test_parse_ini_continuation_lines(tmp_path):
+    filename = write_ini(tmp_path, "[SECTION]\nkey=first\n  second\n\n\tthird\nother=value\n\n")
+    assert parse_ini(filename) == {"SECTION": {"key": "first\nsecond\n\nthird", "other": "value"}}
+
+
+def test_parse_ini_only_splits_on_newlines(tmp_path):
+    filename = write_ini(tmp_path, "[A]\r\nkey=first\x0csecond\x1cthird\x85\u2028end\r\nother=value\n")
+    assert parse_ini(filename) == {"A": {"key": "first\x0csecond\x1cthird\x85\u2028end", "other": "value"}}
+
+
+def test_parse_ini_merges_files(tmp_path):
+    sections = parse_ini(write_ini(tmp_path, "[A]\nkey=1\nother=2\n", name="first.XVI"))
+    parse_ini(write_ini(tmp_path, "[A]\nkey=3\n[B]\nkey=4\n", name="second.INI"), sections)
+    assert sections == {"A": {"key": "3", "other": "2"}, "B": {"key": "4"}}
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "[A]\nkey=1\n[A]\nother=2\n",  # Duplicate section
+        "[A]\nkey=1\nKEY=2\n",  # Duplicate key
+        "key=1\n",  # Key outside of a section
+        "[A]\nkey without value\n",
+        "[DEFAULT]\nkey=1\n[A]\nother=2\n",
+    ],
+)
+def test_parse_ini_invalid(tmp_path, text):
+    with pytest.raises(IOError):
+        parse_ini(write_ini(tmp_path, text))
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""Tests for `xdrt.xdr_reader`."""
+
+import numpy as np
+import pytest
+
+from xdrt import xdr_reader
+
+SCAN_TO_SIDDON = "1 0 0 0 0 1 0 0 0 0 1 0 0 0 0 1"
+
+
+def write_xdr(filename, data, xdr_dtype="xdr_short", phase=None, external_data=None):
+    """Write an uncompressed XDR file with the data in the order of the numpy array (time axis first).
+
+    If external_data is set, the data and extents are written to that file next to the XDR file instead.
+    """
+    shape = data.shape[::-1]
+    header_lines = ["# AVS field file", f"ndim={len(shape)}"]
+    header_lines += [f"dim{idx + 1}={size}" for idx, size in enumerate(shape)]
+    header_lines += ["nspace=3", "veclen=1", f"data={xdr_dtype}", "field=uniform", f"#$$ScanToSiddon={SCAN_TO_SIDDON}"]
+    if phase is not None:
+        header_lines.append("#$$PH=" + " ".join(map(str, phase)))
+    if external_data is not None:
+        header_lines.append(f"variable 1 file={external_data} filetype=binary skip=0")
+
+    extents = np.asarray([[-size / 2, size / 2] for size in shape], dtype=">f4")
+    binary_data = data.astype(data.dtype.newbyteorder(">")).tobytes() + extents.tobytes()
+    with open(filename, "wb") as f:
+        f.write(("\n".join(header_lines) + "\n").encode() + b"\x0c\x0c")
+        if external_data is None:
+            f.write(binary_data)
+    if external_data is not None:
+        with open(filename.parent / external_data, "wb") as f:
+            f.write(binary_data)
+
+
+@pytest.fixture
+def xdr_4d_with_phase(tmp_path):
+    data = np.random.default_rng(0).integers(-1000, 3000, size=(4, 5, 6, 7)).astype(np.int16)
+    phase = np.asarray([0.1, 0.2, 0.3, 0.4])
+    filename = tmp_path / "phase.xdr"
+    write_xdr(filename, data, phase=phase)
+    return filename, data, phase
+
+
+def test_read_phase(xdr_4d_with_phase):
+    filename, data, phase = xdr_4d_with_phase
+    xdr_image = xdr_reader.read(filename)
+    np.testing.assert_array_equal(xdr_image.data, data)
+    np.testing.assert_array_equal(xdr_image.header.phase, phase)
+
+
+def test_weighted_temporal_average(xdr_4d_with_phase):
+    filename, data, phase = xdr_4d_with_phase
+    xdr_image = xdr_reader.postprocess_xdr_image(
+        xdr_reader.read(filename), temporal_average="weighted", slope=None, intercept=None, cast=None
+    )
+    assert xdr_image.header.ndim == 3
+    np.testing.assert_allclose(xdr_image.data, np.tensordot(phase, data, 1))
+
+
+def test_mean_temporal_average(xdr_4d_with_phase):
+    filename, data, _ = xdr_4d_with_phase
+    xdr_image = xdr_reader.postprocess_xdr_image(
+        xdr_reader.read(filename), temporal_average="mean", slope=None, intercept=None, cast=None
+    )
+    # This is an average over the time points, not the sum.
+    np.testing.assert_allclose(xdr_image.data, data.mean(axis=0))
+
+
+@pytest.mark.parametrize("xdr_dtype, dtype", [("xdr_short", np.int16), ("xdr_integer", np.int32), ("byte", np.uint8)])
+def test_weighted_temporal_average_integer_data(tmp_path, xdr_dtype, dtype):
+    # Values at the limits of the integer type, a product or sum in the integer dtype would overflow.
+    info = np.iinfo(dtype)
+    data = np.full((3, 2, 3, 4), info.max, dtype=dtype)
+    data[1] = info.min
+    phase = np.asarray([0.5, 0.25, 0.25])
+    filename = tmp_path / "integer.xdr"
+    write_xdr(filename, data, xdr_dtype=xdr_dtype, phase=phase)
+
+    xdr_image = xdr_reader.postprocess_xdr_image(
+        xdr_reader.read(filename), temporal_average="weighted", slope=None, intercept=None, cast=None
+    )
+    assert xdr_image.data.dtype == np.float64
+    np.testing.assert_allclose(xdr_image.data, np.tensordot(phase, data.astype(np.float64), 1))
+
+
+@pytest.mark.parametrize("xdr_dtype, dtype", [("xdr_short", np.int16), ("xdr_real", np.float32), ("byte", np.uint8)])
+def test_read_external_data(tmp_path, monkeypatch, xdr_dtype, dtype):
+    data = np.random.default_rng(0).integers(0, 255, size=(5, 6, 7)).astype(dtype)
+    write_xdr(tmp_path / "external.xdr", data, xdr_dtype=xdr_dtype, external_data="external.raw")
+
+    # The external file is found next to the XDR file, regardless of the working directory.
+    monkeypatch.chdir(tmp_path.parent)
+    xdr_image = xdr_reader.read(tmp_path / "external.xdr")
+    assert xdr_image.header.external_data == str(tmp_path / "external.raw")
+    np.testing.assert_array_equal(xdr_image.data, data)
+    np.testing.assert_array_equal(xdr_image.header.max_ext, [35.0, 30.0, 25.0])
+
+
+def test_read_external_data_extra_bytes(tmp_path):
+    data = np.zeros((2, 3, 4), dtype=np.int16)
+    write_xdr(tmp_path / "external.xdr", data, external_data="external.raw")
+    with open(tmp_path / "external.raw", "ab") as f:
+        f.write(b"\x00")
+
+    with pytest.raises(IOError, match="Unexpected extra bytes"):
+        xdr_reader.read(tmp_path / "external.xdr")
@@ -6,4 +6,21 @@ __author__ = """Jonas Teuwen"""
 __email__ = "j.teuwen@nki.nl"
 __version__ = "0.2.2-dev0"
 
-from .xdr_reader import read, read_as_simpleitk
+import importlib
+import sys
+
+_LAZY_ATTRIBUTES = ("read", "read_as_simpleitk")
+# Submodules that were available as attributes after `import xdrt` when the reader was imported eagerly.
+_LAZY_SUBMODULES = ("utils", "xdr_reader")
+
+if sys.version_info < (3, 7):
+    from .xdr_reader import read, read_as_simpleitk
+else:
+
+    def __getattr__(name):
+        # Importing the reader pulls in SimpleITK, so this is deferred until the reader is actually used (PEP 562).
+        if name in _LAZY_SUBMODULES:
+            return importlib.import_module(f"{__name__}.{name}")
+        if name in _LAZY_ATTRIBUTES:
+            return getattr(importlib.import_module(f"{__name__}.xdr_reader"), name)
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -2,7 +2,7 @@
 # Copyright (c) Jonas Teuwen
 import argparse
 import logging
-import pathlib
+import os
 import sys
 
 from xdrt.cli.utils import BaseArgs, read_xdr_as_simpleitk, setup_logging, write_simpleitk_image
@@ -12,16 +12,16 @@ def main():
     """Console script for xdr2img."""
     base_parser = BaseArgs("xdr2img converts XDR images to other medical imaging formats.")
     parser = argparse.ArgumentParser(parents=[base_parser], add_help=True)
-    parser.add_argument("INPUT_XDR", type=pathlib.Path, help="Path to XDR file.")
+    parser.add_argument("INPUT_XDR", type=os.fspath, help="Path to XDR file.")
     parser.add_argument(
         "OUTPUT_IMAGE",
-        type=pathlib.Path,
+        type=os.fspath,
         help="Path to output image including extension.",
     )
     args = parser.parse_args()
     setup_logging(args.verbose)
 
-    logging.info(f"Reading {args.INPUT_XDR}...")
+    logging.info("Reading %s...", args.INPUT_XDR)
 
     sitk_image = read_xdr_as_simpleitk(
         args.INPUT_XDR,
@@ -43,7 +43,7 @@ def main():
         extra_metadata=None,
     )
 
-    logging.info(f"Wrote output to {args.OUTPUT_IMAGE}.")
+    logging.info("Wrote output to %s.", args.OUTPUT_IMAGE)
 
     return 0
 
@@ -2,7 +2,7 @@
 # Copyright (c) Jonas Teuwen
 import argparse
 import logging
-import pathlib
+import os
 import sys
 from datetime import datetime
 
@@ -21,7 +21,7 @@ def read_xvi(input_folder) -> XVIReconstruction:
     try:
         xvi_reconstruction = XVIReconstruction(input_folder)
     except RuntimeError as e:
-        logging.error(f"Loading XVI folder failed: {e}")
+        logging.error("Loading XVI folder failed: %s", e)
         sys.exit()
 
     return xvi_reconstruction
@@ -35,12 +35,12 @@ def write_to_dicom():
     )
 
     parser = argparse.ArgumentParser(parents=[base_parser], add_help=True)
-    parser.add_argument("INPUT_XVI", type=pathlib.Path, help="Path to XVI reconstruction folder.")
+    parser.add_argument("INPUT_XVI", type=os.fspath, help="Path to XVI reconstruction folder.")
     parser.add_argument("OUTPUT_DIRECTORY", type=dir_path, help="Path to write output to.")
 
     args = parser.parse_args()
     setup_logging(args.verbose)
-    logging.info(f"Reading {args.INPUT_XVI}...")
+    logging.info("Reading %s...", args.INPUT_XVI)
     xvi_reconstruction = read_xvi(args.INPUT_XVI)
 
     filename = xvi_reconstruction.scan.filename
@@ -94,12 +94,12 @@ def write_to_image():
     )
 
     parser = argparse.ArgumentParser(parents=[base_parser], add_help=True)
-    parser.add_argument("INPUT_XVI", type=pathlib.Path, help="Path to XVI reconstruction folder.")
-    parser.add_argument("OUTPUT_FILE", type=pathlib.Path, help="Path to write output to.")
+    parser.add_argument("INPUT_XVI", type=os.fspath, help="Path to XVI reconstruction folder.")
+    parser.add_argument("OUTPUT_FILE", type=os.fspath, help="Path to write output to.")
 
     args = parser.parse_args()
     setup_logging(args.verbose)
-    logging.info(f"Reading {args.INPUT_XVI}...")
+    logging.info("Reading %s...", args.INPUT_XVI)
     extra_metadata = {}
     xvi_reconstruction = read_xvi(args.INPUT_XVI)
 
@@ -135,6 +135,6 @@ def write_to_image():
         extra_metadata=extra_metadata,
     )
 
-    logging.info(f"Wrote output to {args.OUTPUT_FILE}.")
+    logging.info("Wrote output to %s.", args.OUTPUT_FILE)
 
     return 0
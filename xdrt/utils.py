@@ -1,5 +1,6 @@
 # coding=utf-8
 # Copyright (c) Jonas Teuwen
+import functools
 import re
 from datetime import datetime
 
@@ -16,10 +17,98 @@ DATATYPES = {
 }
 
 
+_CAMEL_CASE_WORD = re.compile("(.)([A-Z][a-z]+)")
+_CAMEL_CASE_BOUNDARY = re.compile("([a-z0-9])([A-Z])")
+
+
 def camel_to_snake(name):
     # From: https://stackoverflow.com/a/1176023
-    name = re.sub("(.)([A-Z][a-z]+)", r"\1_\2", name)
-    return re.sub("([a-z0-9])([A-Z])", r"\1_\2", name).lower()
+    name = _CAMEL_CASE_WORD.sub(r"\1_\2", name)
+    return _CAMEL_CASE_BOUNDARY.sub(r"\1_\2", name).lower()
+
+
+_INI_SECTION = re.compile(r"^\[(.+)\]")
+_INI_KEY_VALUE = re.compile(r"^([^=:]+?)\s*[=:]\s*(.*)$")
+
+
+def parse_ini(filename, sections=None):
+    """
+    Parse a configuration file such as the XVI and INI files, following the format accepted by configparser. Keys
+    and values are separated by the first `=` or `:`, indented lines continue the value of the previous key and
+    lines starting with `#` or `;` are comments. Keys are lowercased as configparser does, values are kept as raw
+    strings without interpolation. Unlike configparser, a `[DEFAULT]` section is not supported and raises an error.
+
+    Parameters
+    ----------
+    filename : PathLike or str
+        Path to the configuration file.
+    sections : dict, optional
+        Dictionary of sections to add the parsed sections to, keys of existing sections are updated.
+
+    Returns
+    -------
+    dict
+        Dictionary mapping section names to a dictionary of keys and values.
+    """
+    # Only split on newlines, splitlines() also splits on characters such as form feeds which configparser keeps.
+    with open(filename) as ini_file:
+        lines = ini_file.read().split("\n")
+
+    sections = {} if sections is None else sections
+    # As in configparser, a file cannot repeat sections or keys within a section, but can update earlier files.
+    seen_sections = set()
+    values = {}  # Lines of every value, keyed by section name and key.
+    curr_section_name = None
+    curr_value = None  # Lines of the value of the last key, as long as it can be continued.
+    key_indent = 0
+    for line_number, line in enumerate(lines, 1):
+        stripped_line = line.strip()
+        if not stripped_line:
+            if curr_value is not None:
+                curr_value.append("")
+            continue
+        if stripped_line[0] in "#;":
+            continue
+
+        indent = len(line) - len(line.lstrip())
+        if curr_value is not None and indent > key_indent:
+            curr_value.append(stripped_line)
+            continue
+
+        section_match = _INI_SECTION.match(stripped_line)
+        if section_match:
+            curr_section_name = section_match.group(1)
+            if curr_section_name == "DEFAULT":
+                raise IOError(f"DEFAULT sections are not supported, found on line {line_number} of {filename}.")
+            if curr_section_name in seen_sections:
+                raise IOError(f"Duplicate section {curr_section_name} on line {line_number} of {filename}.")
+            seen_sections.add(curr_section_name)
+            sections.setdefault(curr_section_name, {})
+            curr_value = None
+            continue
+
+        key_value_match = _INI_KEY_VALUE.match(stripped_line)
+        if not key_value_match or curr_section_name is None:
+            raise IOError(f"Cannot parse line {line_number} of {filename}: {stripped_line}.")
+        key = key_value_match.group(1).lower()
+        if (curr_section_name, key) in values:
+            raise IOError(f"Duplicate key {key} in section {curr_section_name} on line {line_number} of {filename}.")
+
+        curr_value = [key_value_match.group(2)]
+        values[(curr_section_name, key)] = curr_value
+        key_indent = indent
+
+    # Join the multi-line values, trailing empty lines are not part of the value.
+    for (section_name, key), value in values.items():
+        sections[section_name][key] = "\n".join(value).rstrip()
+
+    return sections
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_datetime(datetime_str, datetime_format):
+    # strptime is slow, and XVI files of the same patient repeat the same dates and times.
+    return datetime.strptime(datetime_str, datetime_format)
 
 
 def parse_xvi_datetime(datetime_str):
@@ -28,14 +117,19 @@ def parse_xvi_datetime(datetime_str):
     else:
         datetime_strp_str = "%Y%m%d_%H:%M:%S"
 
-    return datetime.strptime(datetime_str, datetime_strp_str) if datetime_str else None
+    return parse_datetime(datetime_str, datetime_strp_str) if datetime_str else None
 
 
 def parse_xvi_url(url):
+    # The same urls are repeated across the XVI files of a patient, a copy is returned as the result is mutable.
+    return dict(_parse_xvi_url(url))
+
+
+@functools.lru_cache(maxsize=2048)
+def _parse_xvi_url(url):
     url_parsed = {}
     for elem in url.split("\\"):
-        name = elem.split(".")[-1]
-        value = elem[: -len(name) - 1]
+        value, _, name = elem.rpartition(".")
         if name == "patient":
             planning_part = "[DICOM planning]:"
             if planning_part not in url:
@@ -44,7 +138,7 @@ def parse_xvi_url(url):
                     "If you want to handle such cases, "
                     "consider opening an issue on https://github.com/NKI-AI/xdrt/issues."
                 )
-            url_parsed[name] = value.split(":")[-1]
+            url_parsed[name] = value.rpartition(":")[2]
         else:
             url_parsed[name] = value
 
@@ -1,7 +1,10 @@
 # coding=utf-8
 # Copyright (c) Jonas Teuwen
 import ctypes
+import functools
 import logging
+import mmap
+import operator
 import string
 import sys
 import warnings
@@ -39,6 +42,12 @@ XDR_DTYPE_TO_PYTHON = {
     "byte": "uint8",
 }
 
+# Big-endian (on disk) and little-endian numpy dtypes for each XDR data type.
+XDR_DTYPE_TO_NUMPY = {
+    key: (np.dtype(value).newbyteorder(">"), np.dtype(value).newbyteorder("<"))
+    for key, value in XDR_DTYPE_TO_PYTHON.items()
+}
+
 XDR_METADATA_KEYS = [
     "#$VERSION",
     "#$PATIENT_ID",
@@ -57,6 +66,15 @@ XDR_METADATA_KEYS = [
     "#$COMMENT",
 ]
 
+# Attribute names under which the metadata keys are stored in the XDRHeader.
+XDR_METADATA_ATTRIBUTES = {key: key[2:].lower() for key in XDR_METADATA_KEYS}
+
+XDR_HEADER_CHUNK_SIZE = 65536
+
+# The geometry of a header is fixed once the extents are read, so it is computed only once where possible.
+# functools.cached_property is only available from Python 3.8, older versions recompute on every access.
+cached_property = getattr(functools, "cached_property", property)
+
 SIDDON_TO_DICOM = np.asarray([[1, 0, 0], [0, 0, -1], [0, 1, 0]])
 
 
@@ -70,12 +88,12 @@ class XDRImage:
 class XDRHeader:
     def __init__(self, header_dict):
         self.__header_dict = header_dict
-        self.__parse_header()
 
-        self.min_ext = []
-        self.max_ext = []
+        self.min_ext = None
+        self.max_ext = None
 
-        self.phase = None
+        self.phase = None  # Set when parsing the header if the XDR has a phase.
+        self.__parse_header()
 
     def __parse_header(self):
         if "#$$url" in self.__header_dict:
@@ -110,7 +128,7 @@ class XDRHeader:
 
         self.__shape = tuple(shape)  # Internally the original order is needed, array itself needs to be flipped.
         self.shape = tuple(shape[::-1])
-        self.size = np.prod(self.__shape)
+        self.size = functools.reduce(operator.mul, self.__shape, 1)  # Plain int, math.prod requires Python 3.8.
 
         self.compression = int(self.__header_dict.get("nki_compression", 0))
 
@@ -121,20 +139,18 @@ class XDRHeader:
         self.scan_to_siddon = None  # Placeholder
         self.parse_array_keys()
 
-        for key in XDR_METADATA_KEYS:
+        for key, save_key in XDR_METADATA_ATTRIBUTES.items():
             value = self.__header_dict.get(key, None)
-            if not value:
-                continue
-            save_key = key[2:].lower()
-            setattr(self, save_key, value)
+            if value:
+                setattr(self, save_key, value)
 
         # Check if file is external
         self.external_data = False
         if "variable 1 file" in self.__header_dict:
-            p = self.__header_dict["xdr_filename"]
-            if p != "":
-                p = f"{p}/"
-            self.external_data = f"{p}{self.__header_dict['variable 1 file'].split(' ')[0]}"
+            # The external file is relative to the directory of the XDR file.
+            self.external_data = path.join(
+                path.dirname(self.__header_dict["xdr_filename"]), self.__header_dict["variable 1 file"].split(" ")[0]
+            )
 
     def parse_array_keys(self):
         array_keys = ["#$$ScanToSiddon", "#$$MatchToSiddon", "#$$PH"]
@@ -143,11 +159,8 @@ class XDRHeader:
             if not array_str:
                 continue
 
-            # Remove double spaces
-            array_str = " ".join(array_str.split())
-            array_str = array_str.split(" ")
-
-            array = np.array([float(_) for _ in array_str])
+            # split() without arguments also handles repeated white space, numpy parses the floats directly.
+            array = np.array(array_str.split(), dtype=np.float64)
             if array_key == "#$$PH":
                 if len(array) != self.shape[0]:
                     raise ValueError(
@@ -171,13 +184,13 @@ class XDRHeader:
         if self.scan_to_siddon is None:
             raise RuntimeError(f"#$$ScanToSiddon could not be parsed or found in XDR header.")
 
-    @property
+    @cached_property
     def spacing(self):
         # Spacing needs to be computed based on the image size and the matrix size.
-        if not self.min_ext and self.max_ext:
+        if self.min_ext is None or self.max_ext is None:
             raise ValueError("min_ext and max_ext need to be set before spacing can be computed.")
 
-        diff = np.asarray(self.max_ext) - np.asarray(self.min_ext)
+        diff = self.max_ext - self.min_ext
         if self.field == "uniform":
             spacing = diff / (np.asarray(self.__shape) - 1)
         elif self.field == "rectilinear":
@@ -193,17 +206,17 @@ class XDRHeader:
 
         return np.round(spacing, 3)  # micrometer resolution
 
-    @property
+    @cached_property
     def affine(self):
         if hasattr(self, "scan_to_siddon"):
-            if not self.min_ext:
+            if self.min_ext is None:
                 raise ValueError("min_ext required to compute affine.")
 
             affine = self.xdr_affine_to_affine(self.scan_to_siddon, self.min_ext)
             return affine
         return None
 
-    @property
+    @cached_property
     def direction(self):
         if self.affine is not None:
             return self.affine[0:3, 0:3].flatten().tolist()
@@ -215,7 +228,7 @@ class XDRHeader:
 
         return default_affine.flatten().tolist()
 
-    @property
+    @cached_property
     def origin(self):
         if self.affine is not None:
             return self.affine[0:3, -1].flatten().tolist()[::-1]
@@ -274,43 +287,30 @@ def read(xdr_filename, stop_before_data=False):
     """
     file_handler = open(xdr_filename, "rb")
 
-    text_header = []
-    form_feed = False
-
-    initial_header = []
-    header_counter = 0
-
-    while True:
-        # Read character by character, until a form feed is encountered
-        next_character = file_handler.read(1)
-
-        # Read until EOF
-        if next_character == "" or (ord(next_character) == 12 and form_feed):
-            break
-
-        text_header.append(next_character)
-        form_feed = ord(next_character) == 12
-
-        if header_counter <= 4:
-            initial_header.append(next_character.decode("utf-8"))
-        elif header_counter == 5:
-            first_header_chars = "".join(initial_header)
-            if first_header_chars != "# AVS":
-                file_handler.close()
-                raise RuntimeError(f"Header of XDR file should start with `# AVS`. Got {first_header_chars}.")
+    # The text header is terminated by two form feeds, read in blocks until these are found.
+    header_buffer = bytearray(file_handler.read(XDR_HEADER_CHUNK_SIZE))
+    if not header_buffer.startswith(b"# AVS"):
+        file_handler.close()
+        first_header_chars = header_buffer[:5].decode("utf-8", errors="replace")
+        raise RuntimeError(f"Header of XDR file should start with `# AVS`. Got {first_header_chars}.")
 
-        header_counter += 1
+    header_end = header_buffer.find(b"\x0c\x0c")
+    while header_end == -1:
+        chunk = file_handler.read(XDR_HEADER_CHUNK_SIZE)
+        if not chunk:
+            file_handler.close()
+            raise IOError(f"End of XDR header not found in {xdr_filename}.")
+        # Start searching one byte back, in case the two form feeds are split over two blocks.
+        search_start = len(header_buffer) - 1
+        header_buffer += chunk
+        header_end = header_buffer.find(b"\x0c\x0c", search_start)
 
-    # Decode text header:
-    decoded_header = []
-    for character in text_header:
-        try:
-            decoded_header.append(character.decode("utf-8"))
-        except UnicodeDecodeError:
-            decoded_header.append("__#ERR#__")
+    # Position the file after the form feeds, at the start of the binary data.
+    file_handler.seek(header_end + 2)
+    text_header = header_buffer[: header_end + 1].decode("utf-8", errors="replace").replace("\ufffd", "__#ERR#__")
 
-    # Join characters to string and remove white space characters
-    header_lines = [_ for _ in ("".join(decoded_header)).splitlines() if _ not in string.whitespace]
+    # Remove white space characters
+    header_lines = [_ for _ in text_header.splitlines() if _ not in string.whitespace]
 
     # Split header lines around =
     header_dict = {"xdr_filename": xdr_filename}
@@ -342,14 +342,18 @@ def read(xdr_filename, stop_before_data=False):
         comp_size = extent_data_offset - image_data_offset
 
         source_data = np.fromfile(file_handler, dtype="uint8", count=comp_size)
-        destination_data = np.zeros(header.size, dtype="<i2")
+        # The decompression writes the data directly into this buffer, which is used as is.
+        raw_data = np.empty(header.size, dtype="<i2")
 
-        nki_compression.nki_private_decompress(
-            destination_data.ctypes.data_as(ctypes.POINTER(ctypes.c_short)),
+        num_decompressed = nki_compression.nki_private_decompress(
+            raw_data.ctypes.data_as(ctypes.POINTER(ctypes.c_short)),
             source_data.ctypes.data_as(ctypes.POINTER(ctypes.c_char)),
             len(source_data),
         )
-        raw_data = np.asarray(destination_data, order="F", dtype="<i2")
+        # The decompression library returns the number of decompressed pixels, or 0 if the data is corrupted.
+        if num_decompressed != header.size:
+            file_handler.close()
+            raise IOError(f"Error in decompressing {xdr_filename}: got {num_decompressed} of {header.size} pixels.")
 
         if not file_handler.tell() == extent_data_offset:
             file_handler.close()
@@ -360,24 +364,42 @@ def read(xdr_filename, stop_before_data=False):
             file_handler.close()
             file_handler = open(header.external_data, "rb")
 
-        dtype = XDR_DTYPE_TO_PYTHON.get(header_dict["data"], False)
-        if not dtype:
-            raise NotImplementedError(f"dtype {dtype} not supported.")
+        if header.original_dtype not in XDR_DTYPE_TO_NUMPY:
+            raise NotImplementedError(f"dtype {header.original_dtype} not supported.")
+        big_endian_dtype, little_endian_dtype = XDR_DTYPE_TO_NUMPY[header.original_dtype]
 
-        if dtype == "uint8":
-            raw_data = np.fromfile(file_handler, dtype="uint8")
-        else:
-            raw_data = np.asarray(
-                np.fromfile(file_handler, dtype=f">{dtype}", count=header.size * header.veclen),
-                order="F",
-                dtype=f"<{dtype}",
+        if header.dtype == "uint8":
+            # Single bytes need no byteswap, so the data is memory-mapped and only read when accessed. The
+            # copy-on-write mode keeps the array writable without modifying the file.
+            offset = file_handler.tell()
+            raw_data = np.memmap(
+                file_handler.name, dtype="uint8", mode="c", offset=offset, shape=(header.size * header.veclen,)
             )
-
-    # AVSField standard defines the min_ext and max_ext based on final bytes.
-    for _ in range(header.ndim):
-        header.min_ext.append(np.fromfile(file_handler, dtype=">f4", count=1)[0] * 10.0)  # * 10. to convert to mm.
-        header.max_ext.append(np.fromfile(file_handler, dtype=">f4", count=1)[0] * 10.0)  # * 10. to convert to mm.
-    if file_handler.tell() != path.getsize(xdr_filename):
+            file_handler.seek(offset + raw_data.nbytes)
+        elif header.external_data:
+            # Memory-map the external data file, the byteswap then reads the mapped pages and writes the swapped
+            # array in a single pass, without first copying the file into a separate buffer.
+            offset = file_handler.tell()
+            count = header.size * header.veclen
+            with mmap.mmap(file_handler.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                raw_data = (
+                    np.frombuffer(mapped_file, dtype=big_endian_dtype, count=count, offset=offset)
+                    .byteswap()
+                    .view(little_endian_dtype)
+                )
+            file_handler.seek(offset + raw_data.nbytes)
+        else:
+            # Swap the big-endian data in-place, this avoids allocating a second array of the same size.
+            raw_data = np.fromfile(file_handler, dtype=big_endian_dtype, count=header.size * header.veclen)
+            raw_data.byteswap(inplace=True)
+            raw_data = raw_data.view(little_endian_dtype)
+
+    # AVSField standard defines the min_ext and max_ext based on final bytes, these are interleaved per dimension.
+    extents = np.fromfile(file_handler, dtype=">f4", count=2 * header.ndim).astype(np.float64) * 10.0  # To mm.
+    header.min_ext = extents[0::2]
+    header.max_ext = extents[1::2]
+    # The data and extents are read from the external file if there is one, so that is the size to check against.
+    if file_handler.tell() != path.getsize(header.external_data or xdr_filename):
         file_handler.close()
         raise IOError("Unexpected extra bytes.")
 
@@ -409,42 +431,100 @@ def postprocess_xdr_image(
     intercept: float,
     cast: str,
 ) -> XDRImage:
-    if temporal_average:
-        logging.info(f"Computing temporal average: {temporal_average}.")
+    if temporal_average and temporal_average not in ["mean", "weighted"]:
+        raise ValueError(f"temporal_average must be either `mean` or `weighted`. Got {temporal_average}.")
+    if cast and cast not in DATATYPES:
+        raise ValueError(f"cast must be one of {list(DATATYPES.keys())}. Got {cast}.")
 
-        if temporal_average not in ["mean", "weighted"]:
-            sys.exit("xdr2img: error: --temporal-average must be either `mean` or `weighted`.")
+    if temporal_average:
+        logging.info("Computing temporal average: %s.", temporal_average)
 
         if xdr_image.header.ndim != 4:
             sys.exit("xdr2img: error: --temporal-average can only be used with 4D images.")
 
-        weights = np.asarray([1.0] * xdr_image.data.shape[0])
+        weights = None
         if temporal_average == "weighted":
-            if not hasattr(xdr_image.header, "phase"):
+            if xdr_image.header.phase is None:
                 logging.warning("Phase is not available. Temporal average will be mean.")
             else:
                 weights = np.asarray(xdr_image.header.phase)
 
-        xdr_image.data = (weights * xdr_image.data.T).T.sum(axis=0)
+        # Contract over the time axis in one pass, rather than a broadcasted product of transposed copies.
+        # einsum without `optimize` casts integer data in buffered chunks, where tensordot (and einsum with
+        # `optimize=True`, which dispatches to it) first casts the complete 4D array to float64.
+        if weights is None:
+            xdr_image.data = xdr_image.data.mean(axis=0)
+        else:
+            xdr_image.data = np.einsum("t,t...->...", weights, xdr_image.data)
         xdr_image.header.ndim = 3  # Data is now 3D
 
     if slope:
-        logging.info(f"Slope set: {slope}.")
-        xdr_image.data = xdr_image.data * make_integer(slope)
-
+        logging.info("Slope set: %s.", slope)
     if intercept:
-        logging.info(f"Intercept set: {intercept}.")
-        xdr_image.data = xdr_image.data + make_integer(intercept)
-
+        logging.info("Intercept set: %s.", intercept)
     if cast:
-        logging.info(f"Casting to: {cast}.")
-        if cast not in list(DATATYPES.keys()):
-            sys.exit(f"xdr2img: error: Expected casting type to be one of {list(DATATYPES.keys())}. Got {cast}.")
-        xdr_image.data = xdr_image.data.astype(DATATYPES[cast])
+        logging.info("Casting to: %s.", cast)
+
+    xdr_image.data = _apply_slope_intercept_cast(
+        xdr_image.data,
+        slope=make_integer(slope) if slope else None,
+        intercept=make_integer(intercept) if intercept else None,
+        dtype=DATATYPES[cast] if cast else None,
+    )
 
     return xdr_image
 
 
+def _apply_slope_intercept_cast(data, slope=None, intercept=None, dtype=None):
+    """Computes `(data * slope + intercept).astype(dtype)`, skipping unset steps.
+
+    Only the first operation allocates a new array, the others are done in-place on that array whenever the
+    dtype promotion rules allow it. The input array is never modified. If numexpr is installed, slope and intercept
+    on floating point data are evaluated as one multi-threaded expression.
+    """
+    # numexpr evaluates the complete expression in the output dtype, whereas numpy computes `data * slope` in the
+    # dtype of that product first (which can overflow for integers). The results only agree if the dtype does not
+    # change between the two steps, and numexpr natively supports it (so not float16).
+    if slope is not None and intercept is not None and data.dtype in (np.float32, np.float64):
+        output_dtype = np.dtype(np.result_type(data, slope))
+        numexpr = _import_numexpr()
+        if numexpr is not None and output_dtype == data.dtype == np.result_type(data, slope, intercept):
+            output = numexpr.evaluate(
+                "data * slope + intercept",
+                local_dict={
+                    "data": data,
+                    "slope": output_dtype.type(slope),
+                    "intercept": output_dtype.type(intercept),
+                },
+            )
+            return output.astype(dtype, copy=False) if dtype is not None else output
+
+    output = None
+    if slope is not None:
+        output = np.multiply(data, slope)
+
+    if intercept is not None:
+        if output is not None and np.result_type(output, intercept) == output.dtype:
+            np.add(output, intercept, out=output)
+        else:
+            output = np.add(data if output is None else output, intercept)
+
+    if dtype is not None:
+        output = (data if output is None else output).astype(dtype, copy=False)
+
+    return data if output is None else output
+
+
+@functools.lru_cache(maxsize=None)
+def _import_numexpr():
+    # Imported on first use, as importing numexpr logs its thread configuration.
+    try:
+        import numexpr
+    except ImportError:
+        return None
+    return numexpr
+
+
 def read_as_simpleitk(xdr_image, lps_orientation=True, save_header=False):
     """Read XDR file as an SimpleITK image.
 
@@ -467,31 +547,27 @@ def read_as_simpleitk(xdr_image, lps_orientation=True, save_header=False):
     data = xdr_image.data
 
     header = xdr_image.header
-    images = []
 
     if header.ndim == 3:
-        images.append(_create_simpleitk_image(data, header))
+        sitk_image = _create_simpleitk_image(data, header)
+        if lps_orientation:
+            sitk_image = _change_orientation(sitk_image)
 
     elif header.ndim == 4:  # Time-axis is 0-th axis.
-        for curr_data in data:
-            images.append(_create_simpleitk_image(curr_data, header))
+        if not lps_orientation or _is_lps_aligned(header.direction):
+            # No reorientation required, so the 4D image can be created at once rather than joining the phases.
+            sitk_image = _create_simpleitk_image(data, header)
+        else:
+            # DICOMOrientImageFilter only supports 3D images, so each phase is reoriented separately.
+            images = [_change_orientation(_create_simpleitk_image(curr_data, header)) for curr_data in data]
+            sitk_image = sitk.JoinSeries(images)
     else:
         raise NotImplementedError("Currently on 3D and 4D XDR is implemented.")
 
-    if lps_orientation:
-        images = [_change_orientation(curr_image) for curr_image in images]
-
-    if len(images) == 1:
-        sitk_image = images[0]
-    else:
-        # Now the image is 4D
-        sitk_image = sitk.JoinSeries(images)
-
     if header.phase is not None:
-        sitk_image.SetMetaData("phase", " ".join([str(_) for _ in header.phase]))
+        sitk_image.SetMetaData("phase", " ".join(map(str, header.phase.tolist())))
     if save_header:
-        for key in XDR_METADATA_KEYS:
-            key = key[2:].lower()
+        for key in XDR_METADATA_ATTRIBUTES.values():
             value = header.__dict__.get(key, None)
             if not value:
                 continue
@@ -502,20 +578,45 @@ def read_as_simpleitk(xdr_image, lps_orientation=True, save_header=False):
 
 def _create_simpleitk_image(data, header):
     sitk_image = sitk.GetImageFromArray(data, isVector=header.veclen > 1)
-    sitk_image.SetSpacing(header.spacing)
+    spacing = list(header.spacing[0:3])
+    origin = list(header.origin)
+    direction = list(header.direction)
+    if sitk_image.GetDimension() == 4:
+        # Extend the 3D geometry with a unit time-axis, as sitk.JoinSeries does.
+        spacing = spacing + [1.0]
+        origin = origin + [0.0]
+        direction = np.eye(4)
+        direction[0:3, 0:3] = np.asarray(header.direction).reshape(3, 3)
+        direction = direction.flatten().tolist()
+
+    sitk_image.SetSpacing(spacing)
     if header.origin:
-        sitk_image.SetOrigin(header.origin)
+        sitk_image.SetOrigin(origin)
     if header.direction:
-        sitk_image.SetDirection(header.direction)
+        sitk_image.SetDirection(direction)
 
     return sitk_image
 
 
+def _is_lps_aligned(direction):
+    """
+    Checks if a 3x3 direction matrix is already in LPS orientation, that is, every image axis is closest to the
+    positive world axis with the same index. In that case `DICOMOrientImageFilter` would not permute or flip the data.
+
+    """
+    direction = np.asarray(direction, dtype=np.float64).reshape(3, 3)
+    dominant_axes = np.abs(direction).argmax(axis=0)
+    return bool(np.array_equal(dominant_axes, np.arange(3)) and np.all(np.diag(direction) > 0))
+
+
 def _change_orientation(sitk_image):
     """
     Changes the underlying data array to LPS orientation.
 
     """
+    if sitk_image.GetDimension() == 3 and _is_lps_aligned(sitk_image.GetDirection()):
+        return sitk_image
+
     curr_filter = sitk.DICOMOrientImageFilter()
     sitk_image = curr_filter.Execute(sitk_image)
     return sitk_image
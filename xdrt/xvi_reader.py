@@ -1,9 +1,12 @@
 # coding=utf-8
 # Copyright (c) Jonas Teuwen
-import configparser
+import os
 import pathlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import NamedTuple
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from xdrt.utils import parse_datetime, parse_ini
 
 
 class Patient(NamedTuple):
@@ -30,6 +33,8 @@ class Scan(NamedTuple):
 
 
 class XVIReconstruction:
+    __slots__ = ("path", "patient", "_reference", "scan", "_data_dict")
+
     def __init__(self, path: pathlib.Path):
         """
         Object holding an XVI file.
@@ -47,18 +52,31 @@ class XVIReconstruction:
         self._reference: _Reference
         self.scan: Scan
 
-        ini_files = self.path.glob("*.INI")
-        xvi_files = self.path.glob("*.XVI")
-        config = configparser.ConfigParser()
+        # Classify the files in a single directory scan, rather than globbing the folder once for every extension.
+        # The extensions are compared case-insensitively on Windows, as glob does.
+        ini_files, xvi_files = [], []
+        try:
+            with os.scandir(self.path) as entries:
+                for entry in entries:
+                    extension = os.path.splitext(os.path.normcase(entry.name))[1]
+                    if extension == os.path.normcase(".INI") and entry.is_file():
+                        ini_files.append(entry.path)
+                    elif extension == os.path.normcase(".XVI") and entry.is_file():
+                        xvi_files.append(entry.path)
+        except OSError as e:
+            raise RuntimeError(f"Cannot read XVI folder {self.path}: {e}.")
+
+        self._data_dict: Dict[str, Dict[str, str]] = {}
         for file in xvi_files:
-            config.read(file)
-        self._data_dict = config._sections  # type: ignore
+            parse_ini(file, self._data_dict)
         self.__parse_config()
 
         for file in ini_files:
-            config.read(file)
+            parse_ini(file, self._data_dict)
 
         self.__parse_identification()
+        # Everything required is parsed, so the configuration itself does not need to be kept in memory.
+        del self._data_dict
 
     def __parse_config(self):
         headers = ["RECONSTRUCTION", "REFERENCE"]
@@ -67,7 +85,7 @@ class XVIReconstruction:
 
         reconstruction = self._data_dict["RECONSTRUCTION"]
         datetime_str = reconstruction["reconstructiondate"] + " " + reconstruction["reconstructiontime"]
-        date_time = datetime.strptime(datetime_str, "%Y%m%d %H:%M:%S")
+        date_time = parse_datetime(datetime_str, "%Y%m%d %H:%M:%S")
 
         reference = self._data_dict["REFERENCE"]
         version = reference["avlversion"]
@@ -85,7 +103,7 @@ class XVIReconstruction:
         patient_id = identification["patientid"]
         first_name = identification["firstname"]
         last_name = identification["lastname"]
-        date_of_birth = datetime.strptime(identification["dob"], "%d.%m.%Y")
+        date_of_birth = parse_datetime(identification["dob"], "%d.%m.%Y")
         self.patient = Patient(
             patient_id=patient_id, first_name=first_name, last_name=last_name, date_of_birth=date_of_birth
         )
@@ -94,8 +112,9 @@ class XVIReconstruction:
         if scan_header not in self._data_dict:
             raise RuntimeError(f"Expected to find header {scan_header} in one of the configuration files.")
 
-        reconstruction_filename = self.path / self._data_dict[scan_header]["reconstruction"]
-        if not reconstruction_filename.is_file():
+        # A plain os.path check avoids the pathlib overhead, the Path is only constructed once the file exists.
+        reconstruction_filename = os.path.join(self.path, self._data_dict[scan_header]["reconstruction"])
+        if not os.path.isfile(reconstruction_filename):
             raise RuntimeError(f"Expected reconstruction filename {reconstruction_filename} to exist.")
 
         self.scan = Scan(
@@ -104,8 +123,29 @@ class XVIReconstruction:
             version=self._reference.version,
             level=self._reference.level,
             window=self._reference.window,
-            filename=reconstruction_filename,
+            filename=pathlib.Path(reconstruction_filename),
         )
 
     def __repr__(self):
         return f"XVIReconstruction(path={self.path}, " f"patient={self.patient}, " f"scan={self.scan})"
+
+
+def read_reconstructions(paths: Iterable[pathlib.Path], num_workers: Optional[int] = None) -> List[XVIReconstruction]:
+    """
+    Read several XVI reconstruction folders in parallel.
+
+    Parameters
+    ----------
+    paths : Iterable[pathlib.Path]
+        Paths to XVI reconstruction folders.
+    num_workers : int, optional
+        Number of threads reading the folders, defaults to the number of processors.
+
+    Returns
+    -------
+    List[XVIReconstruction]
+        The reconstructions in the same order as paths.
+    """
+    # Parsing the folders is dominated by directory scans and file reads, these overlap across threads.
+    with ThreadPoolExecutor(max_workers=num_workers or os.cpu_count()) as executor:
+        return list(executor.map(XVIReconstruction, paths))